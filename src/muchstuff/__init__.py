@@ -1,3 +1,11 @@
-from .main import main  # noqa
-
 __version__ = "0.4.4"
+
+
+def __getattr__(name):
+    # Imported lazily, so process pool workers unpickling a splitter from
+    # muchstuff.vcs don't load the whole TUI along with it
+    if name == 'main':
+        from .main import main
+        globals()['main'] = main
+        return main
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -34,17 +34,29 @@ def widget_tree(root: Widget, indent: int = 0, increase: int = 4, ignore: Iterab
     return ('' if indent else '\n')+output
 
 
+def _running_tasks():
+    # Task names are "repo <task type> <repo name>" or "repo worker <repo name>", see RepoManager
+    for task in app.screen._manager._tasks:
+        _, vtype, reponame = task.get_name().split(' ', 2)
+        yield vtype, reponame, task
+
+
+def _queued(vtype: str, reponame: str) -> str:
+    if vtype != 'worker':
+        return ''
+    return str(app.screen._manager._queues[reponame].qsize())
+
+
 def _tasks(task_type: str):
-    from .tui import TaskType
-    table = [('Type', 'Repo Name', 'Task ID', 'State')]
+    table = [('Type', 'Repo Name', 'Task ID', 'State', 'Queued')]
     match task_type:
         case 'all':
-            for vtype, repos in app.screen._manager._background_tasks.items():
-                for reponame, task in repos.items():
-                    table.append((vtype, reponame, str(id(task)), task._state))
-        case 'update' | 'files' | 'diff' | 'commits' | 'commits_diff':
-            for reponame, task in app.screen._manager._background_tasks[TaskType[task_type]].items():
-                table.append((task_type, reponame, str(id(task)), task._state))
+            for vtype, reponame, task in _running_tasks():
+                table.append((vtype, reponame, str(id(task)), task._state, _queued(vtype, reponame)))
+        case 'worker' | 'update' | 'diff' | 'commits' | 'commits_diff':
+            for vtype, reponame, task in _running_tasks():
+                if vtype == task_type:
+                    table.append((task_type, reponame, str(id(task)), task._state, _queued(vtype, reponame)))
         case _:
             return 'invalid task_type'
     table = AsciiTable(table)
@@ -67,7 +79,7 @@ def screen_stack(ctx):
 
 def task_type_completer(ctx, param, incomplete):
     from .tui import TaskType
-    return [vtype.name for vtype in TaskType if vtype.name.startswith(incomplete)]
+    return [vtype for vtype in ('worker', *(tt.name for tt in TaskType)) if vtype.startswith(incomplete)]
 
 
 def repo_name_completer(ctx, param, incomplete):
@@ -78,11 +90,10 @@ def repo_name_completer(ctx, param, incomplete):
 @click.argument('repo_name', shell_complete=repo_name_completer)
 @auto_command_done
 def taskps(ctx, task_type: str, repo_name: str):
-    from .tui import TaskType
     try:
-        task = app.screen._manager._background_tasks[TaskType[task_type]][repo_name]
-    except LookupError as lue:
-        return f"No such task: {lue}"
+        task = next(task for vtype, reponame, task in _running_tasks() if (vtype, reponame) == (task_type, repo_name))
+    except StopIteration:
+        return f"No such running task: {task_type} {repo_name}"
 
     ret = f"\n{task.get_name()}:\n  Result:\n"
 
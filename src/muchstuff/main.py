@@ -17,10 +17,16 @@ def parse_args():
 
 
 def _run(app: App, debug: bool):
-    if debug:
-        return app._debug_run()
-    else:
+    try:
+        import uvloop
+    except ImportError:
+        if debug:
+            return app._debug_run()
         return app.run()
+    # Only this run gets a uvloop loop, no global event loop policy is installed
+    if debug:
+        return app._debug_run(uvloop.run)
+    return uvloop.run(app.run_async())
 
 
 def main(args: argparse.Namespace | None = None) -> int:
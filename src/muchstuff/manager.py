@@ -6,7 +6,7 @@ import concurrent.futures as cf
 import dataclasses
 import enum
 from functools import partial
-from typing import Any, Literal, TypeAlias
+from typing import Any, ClassVar, Literal, TypeAlias
 try:
     from typing import Self
 except ImportError:
@@ -29,11 +29,13 @@ class TaskType(enum.Enum):
     commits_diff = enum.auto()
 
 
+_SENTINEL = object()
+
 #TODO properly adjust
 ScCallable: TypeAlias = Callable[[Self], ...] | None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class VCSWrapper:
     vcs: vcs.VCS
     update: TaskState = TaskState.initial
@@ -42,23 +44,40 @@ class VCSWrapper:
     commits_diff: TaskState = TaskState.initial
     state_change_cb: ScCallable = dataclasses.field(default=None, repr=False, kw_only=True)
 
+    _TRACKED: ClassVar[frozenset[str]] = frozenset(tt.name for tt in TaskType)
+
     def __setattr__(self, name, value):
-        if self.state_change_cb is not None:
-            self.state_change_cb(self)
-        super().__setattr__(name, value)
+        old = getattr(self, name, _SENTINEL)
+        # No zero-argument super() here, it breaks with slots=True before Python 3.14
+        object.__setattr__(self, name, value)
+        # Slots are empty until __init__ assigned them, and state_change_cb comes last
+        if name in self._TRACKED and old is not value and (cb := getattr(self, 'state_change_cb', None)) is not None:
+            cb(self)
 
 
-BgCallable: TypeAlias = Callable[[], str]
+BgCallable: TypeAlias = Callable[..., Awaitable[str]]
 PreCallable: TypeAlias = Callable[[VCSWrapper], Awaitable]
 PostCallable: TypeAlias = Callable[[str | tuple[str, Exception], VCSWrapper, bool], Awaitable]
+# Needs to be picklable, as it's run in a separate process
+SplitCallable: TypeAlias = Callable[[str, vcs.VCS], list[tuple[str, str]]]
 
 
 class RepoManager:
-    def __init__(self, repos: Mapping[str, vcs.VCS], state_change_cb: ScCallable = None, *args, **kwargs):
+    def __init__(self, repos: Mapping[str, vcs.VCS], state_change_cb: ScCallable = None, *args, max_workers: int = 10, **kwargs):
         self.repos: dict[str, VCSWrapper] = {name: VCSWrapper(repo, state_change_cb=state_change_cb) for name, repo in repos.items()}
-        self._executor = cf.ProcessPoolExecutor()
+        # Updates, diffs and logs are git/hg subprocesses driven by the event loop
+        # directly, this only limits how many of them run at once. Splitting their
+        # output is pure python though, so that gets a (small) process pool.
+        self._subprocess_limit = asyncio.Semaphore(max_workers)
+        self._proc_executor = cf.ProcessPoolExecutor(max_workers=2)
         atexit.register(self.shutdown, force=True)
-        self._background_tasks: dict[TaskType, dict[str, Awaitable]] = {vt: {} for vt in TaskType}
+        # Only here to keep references to running tasks, finished ones drop out
+        self._tasks: set[asyncio.Task] = set()
+        # One long-lived worker per repo, fed through its queue; started lazily
+        self._queues: dict[str, asyncio.Queue] = {}
+        # Task names of queued or running jobs, so each one is only run once at a time
+        self._pending: set[str] = set()
+        self._init_task: asyncio.Task | None = None
         self.results: dict[TaskType, dict[str, str]] = {vt: {} for vt in TaskType}
 
     def __del__(self):
@@ -66,43 +85,81 @@ class RepoManager:
 
     def shutdown(self, *, force: bool = False):
         with suppress(Exception):
-            for proc in self._executor._processes.values():
+            for proc in self._proc_executor._processes.values():
                 proc.terminate()
         with suppress(Exception):
-            for proc in self._executor._processes.values():
+            for proc in self._proc_executor._processes.values():
                 proc.kill()
-        self._executor.shutdown(cancel_futures=force)
-
-    async def _background(self, executor: cf.Executor | None, fn: BgCallable, *args: Any, pre: PreCallable, post: PostCallable, name: str, dct: MutableMapping | None = None):
-        await pre(vcs=self.repos[name])
+        self._proc_executor.shutdown(cancel_futures=force)
+        # Cancelling kills the git/hg processes still running
+        for task in list(self._tasks):
+            with suppress(Exception):
+                task.cancel()
+
+    async def _background(self, fn: BgCallable, *args: Any, pre: PreCallable, post: PostCallable, name: str, taskname: str, dct: MutableMapping | None = None):
+        # pre/post only touch the UI, so don't hold up dispatching the actual
+        # work for them. post still has to wait for pre to have set things up.
+        pre_task = asyncio.create_task(pre(vcs=self.repos[name]))
         try:
-            if executor is None:
-                result = fn(*args)
-            else:
-                result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            async with self._subprocess_limit:
+                result = await fn(*args)
         except Exception as exc:
-            result = asyncio.current_task().get_name(), exc
+            result = taskname, exc
             success = False
         else:
             success = True
+        await pre_task
         if dct is not None:
             dct[name] = result
-        await post(result, vcs=self.repos[name], success=success)
+        self._track(asyncio.create_task(post(result, vcs=self.repos[name], success=success), name=taskname))
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            args, kwargs = await queue.get()
+            try:
+                await self._background(*args, **kwargs)
+            except Exception as exc:
+                # Don't let one broken job take down all later ones for this repo
+                asyncio.get_running_loop().call_exception_handler({
+                    'message': f'Unhandled exception in background job {kwargs["taskname"]}',
+                    'exception': exc,
+                })
+            finally:
+                self._pending.discard(kwargs['taskname'])
+                queue.task_done()
+
+    def _enqueue(self, *args: Any, name: str, **kwargs: Any):
+        try:
+            queue = self._queues[name]
+        except KeyError:
+            queue = self._queues[name] = asyncio.Queue()
+            self._track(asyncio.create_task(self._worker(queue), name=f'repo worker {name}'))
+        queue.put_nowait((args, kwargs | {'name': name}))
+
+    async def _init_all(self, pre: PreCallable, post: PostCallable):
+        await asyncio.gather(*(
+            self._background(
+                repo.vcs.update_or_clone,
+                pre=pre,
+                post=post,
+                name=name,
+                taskname=f'repo {TaskType.update.name} {name}',
+                dct=self.results[TaskType.update],
+            ) for name, repo in self.repos.items()
+        ))
 
     def background_init(self, pre: PreCallable, post: PostCallable):
-        self._background_tasks[TaskType.update] = {
-            name: asyncio.create_task(
-                self._background(
-                    self._executor,
-                    repo.vcs.update_or_clone(),
-                    pre=pre,
-                    post=post,
-                    name=name,
-                    dct=self.results[TaskType.update],
-                ),
-                name = f'repo update/clone {name}',
-            ) for name, repo in self.repos.items()
-        }
+        # One task for all initial updates; per repo workers are only started
+        # once diffs/commits of that repo are actually requested
+        self._init_task = self._track(asyncio.create_task(
+            self._init_all(pre, post),
+            name=f'repo {TaskType.update.name} <all>',
+        ))
 
     def runable_diff(self, reponame: str) -> str | Literal[False]:
         try:
@@ -115,30 +172,38 @@ class RepoManager:
 
     runable_commits = runable_diff
 
+    def split(self, reponame: str, splitter: SplitCallable, content: str) -> Awaitable[list[tuple[str, str]]]:
+        return asyncio.get_running_loop().run_in_executor(
+            self._proc_executor,
+            splitter,
+            content,
+            self.repos[reponame].vcs,
+        )
+
     def _background_task_with_diff_args(
         self,
         reponame: str,
         fn: BgCallable,
         pre: PreCallable,
         post: PostCallable,
-        task_dct: MutableMapping,
         result_dct: MutableMapping,
         task_name: str = '',
     ) -> bool:
         if not (difftxt := self.runable_diff(reponame)):
             return False
-
-        task_dct[reponame] = asyncio.create_task(
-            self._background(
-                self._executor,
-                fn,
-                *difftxt,
-                pre=pre,
-                post=post,
-                name=reponame,
-                dct=result_dct,
-            ),
-            name = task_name,
+        # Already queued or running, its post will show the result
+        if task_name in self._pending:
+            return True
+
+        self._pending.add(task_name)
+        self._enqueue(
+            fn,
+            *difftxt,
+            pre=pre,
+            post=post,
+            name=reponame,
+            taskname=task_name,
+            dct=result_dct,
         )
         return True
 
@@ -148,9 +213,8 @@ class RepoManager:
             self.repos[reponame].vcs.diff,
             pre=pre,
             post=post,
-            task_dct=self._background_tasks[TaskType.diff],
             result_dct=self.results[TaskType.diff],
-            task_name=f'repo diff {reponame}'
+            task_name=f'repo {TaskType.diff.name} {reponame}'
         )
 
     def background_commits(self, reponame: str, pre: PreCallable, post: PostCallable, with_diff: bool = False) -> bool:
@@ -159,7 +223,6 @@ class RepoManager:
             partial(self.repos[reponame].vcs.commits, with_diff=with_diff),
             pre=pre,
             post=post,
-            task_dct=self._background_tasks[TaskType.commits_diff] if with_diff else self._background_tasks[TaskType.commits],
             result_dct=self.results[TaskType.commits_diff] if with_diff else self.results[TaskType.commits],
-            task_name=f'repo commits{"diff" if with_diff else ""} {reponame}',
+            task_name=f'repo {(TaskType.commits_diff if with_diff else TaskType.commits).name} {reponame}',
         )
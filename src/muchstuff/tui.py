@@ -1,16 +1,16 @@
 import asyncio
-from collections.abc import Awaitable, Callable, Generator
+from collections.abc import Awaitable, Callable
 from contextlib import suppress
 import dataclasses
 from functools import partial
+import io
 import itertools as it
-from operator import attrgetter
 import time
 try:
     import tomllib
 except ImportError:
     import tomli as tomllib
-from typing import TypeAlias
+from typing import Any, TypeAlias
 
 import rich.text
 from rich.traceback import Traceback
@@ -29,7 +29,7 @@ from textual.events import DescendantFocus, Focus
 from textual.widgets.tabbed_content import ContentTab, ContentTabs
 
 from . import vcs
-from .manager import RepoManager, TaskState, VCSWrapper, TaskType
+from .manager import RepoManager, SplitCallable, TaskState, VCSWrapper, TaskType
 
 
 GUIText: TypeAlias = str | rich.text.Text | tuple[str, str]
@@ -75,7 +75,7 @@ class MyVertical(VerticalScroll):
     def action_toggle_open_all(self):
         for c in self.query(Collapsible):
             c.collapsed = not c.collapsed
-        self.call_after_refresh(self.app.refresh_bindings)
+        self.app._schedule_bindings_refresh()
 
     def check_action(self, action: str, params) -> bool:
         match action:
@@ -239,11 +239,12 @@ class DefaultScreen(Screen):
 
     hide_unchanged = reactive(False)
 
+    # (view, sign, VCSWrapper field holding the view's state)
     _char_state = (
-        (TaskType.update, 'U', attrgetter('update')),
-        (TaskType.diff, 'D', attrgetter('diff')),
-        (TaskType.commits, 'C', attrgetter('commits')),
-        (TaskType.commits_diff, 'P', attrgetter('commits_diff')),
+        (TaskType.update, 'U', 'update'),
+        (TaskType.diff, 'D', 'diff'),
+        (TaskType.commits, 'C', 'commits'),
+        (TaskType.commits_diff, 'P', 'commits_diff'),
     )
 
     state_colors = {
@@ -257,7 +258,7 @@ class DefaultScreen(Screen):
         super().__init__()
         try:
             self._manager = RepoManager(
-                {repo.name: repo for repo in vcs.get_repos(self.app._config_path)},
+                dict(vcs.get_repos(self.app._config_path)),
                 state_change_cb = lambda vcs: self.post_message(StateChange(vcs)),
             )
         except (FileNotFoundError, tomllib.TOMLDecodeError) as exc:
@@ -266,6 +267,18 @@ class DefaultScreen(Screen):
             self.call_after_refresh(self.app.push_screen, CriticalError(exc, "Error reading configuration"))
         else:
             self._empty_message = '[italic]Nothing new[/italic]'
+        self._tab_by_name: dict[str, ContentTab] = {}
+        self._active_repo: str | None = None
+        self._active_tab: ContentTab | None = None
+        self._last_title_state: dict[str, tuple] = {}
+        self._dirty_titles: set[str] = set()
+        self._title_flush_scheduled = False
+        self._upper_titles: dict[tuple[tuple[TaskState, ...], str | None], rich.text.Text] = {}
+        self._lower_titles: dict[tuple[tuple[bool, ...], bool], rich.text.Text] = {}
+        # Widgets on the hot paths, so we don't need to run CSS queries for them
+        self._switcher_cache: dict[str, ContentSwitcher] = {}
+        self._vert_cache: dict[tuple[str, str], MyVertical] = {}
+        self._log_cache: dict[tuple[str, str], Log] = {}
 
     def __del__(self):
         self.shutdown()
@@ -274,23 +287,43 @@ class DefaultScreen(Screen):
         self._manager.shutdown(force=force)
 
     def compose(self):
-        with TabbedContent(id="main"):
+        # Keep a reference right away, check_action needs it on every keypress
+        with TabbedContent(id="main") as self._tabbed:
             for reponame in self._manager.repos:
                 with TabPane(reponame, id=reponame):
-                    with ContentSwitcher(initial='update', id=reponame):
-                        with MyVertical(id='update'):
-                            yield Log(id='update', auto_scroll=False, classes="log")
+                    with ContentSwitcher(initial='update', id=reponame) as cs:
+                        with MyVertical(id='update') as vert:
+                            log = Log(id='update', auto_scroll=False, classes="log")
+                            yield log
+                    self._switcher_cache[reponame] = cs
+                    self._vert_cache[(reponame, 'update')] = vert
+                    self._log_cache[(reponame, 'update')] = log
         yield Footer()
         yield DoneCounter(id='donecounter', max=len(self._manager.repos))
 
     def on_mount(self):
-        if not len(self._manager.repos):
-            self.post_message(TabbedContent.Cleared(self.query_exactly_one(TabbedContent)))
+        self._tab_by_name = {name: self._tabbed.get_tab(name) for name in self._manager.repos}
+        self._content_tabs = self.query_exactly_one(ContentTabs)
+        self._done_counter = self.query_exactly_one(DoneCounter)
 
-        self._manager.background_init(
-            partial(self._pre, view=TaskType.update),
-            partial(self._post, receiver_tab=TaskType.update, setter=self._log_setter),
-        )
+        if not len(self._manager.repos):
+            self.post_message(TabbedContent.Cleared(self._tabbed))
+
+        files_setter = partial(self._collapsible_setter, splitter=self._gen_splitter('split_into_files'))
+        commits_setter = partial(self._collapsible_setter, splitter=self._gen_splitter('split_into_commits'))
+        setters = {
+            TaskType.update: self._log_setter,
+            TaskType.diff: files_setter,
+            TaskType.commits: commits_setter,
+            TaskType.commits_diff: commits_setter,
+        }
+        # Built once, so keypresses don't need to create any callbacks
+        self._pre_post: dict[TaskType, tuple[Callable[..., Awaitable], Callable[..., Awaitable]]] = {
+            tt: (partial(self._pre, view=tt), partial(self._post, receiver_tab=tt, setter=setters[tt]))
+            for tt in TaskType
+        }
+
+        self._manager.background_init(*self._pre_post[TaskType.update])
 
         for wd in it.chain(self.query(ContentTabs), self.query(ContentTab)):
             wd.can_focus = False
@@ -352,37 +385,35 @@ class DefaultScreen(Screen):
                 cts.show(ct.sans_prefix(ct.id))
         if tc.active == '__empty':
             tc.active = tc.query_one(TabPane).id
-        self.call_after_refresh(self.app.refresh_bindings)
+        self.app._schedule_bindings_refresh()
 
     @on(TabbedContent.TabActivated)
     def _move_active_class(self, event):
-        self.query(ContentTab).remove_class("active")
+        if self._active_tab is not None:
+            self._active_tab.remove_class("active")
         event.tab.add_class("active")
+        self._active_tab = event.tab
+        self._active_repo = event.pane.id
         event.pane.query_exactly_one(ContentSwitcher).visible_content.focus()
-        self.app.refresh_bindings()
+        self.app._schedule_bindings_refresh()
 
     def check_action(self, name: str, params):
         match name:
             case 'show_pane':
                 match params:
                     case ('update', ):
-                        return self.query_exactly_one(TabbedContent).active != '__empty'
+                        return self._tabbed.active != '__empty'
                     case ('diff', ) | ('commits', ) | ('commits_diff', ):
-                        try:
-                            id = self.query_exactly_one('ContentTab.-active').id
-                        except NoMatches:
-                            return False
-                        else:
-                            return bool(self._manager.runable_diff(ContentTab.sans_prefix(id)))
+                        return bool(self._active_repo and self._manager.runable_diff(self._active_repo))
                     case _:
                         raise RuntimeError("UNREACHABLE")
             case 'previous_tab' | 'next_tab':
-                if len([ct for ct in self.query('ContentTab') if not ct.disabled]) > 1:
+                if sum(1 for ct in self._tab_by_name.values() if not ct.disabled) > 1:
                     return True
                 else:
                     return False
             case 'search':
-                return self.query_exactly_one(TabbedContent).active != '__empty'
+                return self._tabbed.active != '__empty'
             case _:
                 return True
 
@@ -392,11 +423,11 @@ class DefaultScreen(Screen):
         except KeyError:
             raise RuntimeError(f'Expected one of {", ".join(v.name for v in TaskType)}, got "{type(panename)=}"') from None
 
-        active_pane = self.query_one(TabbedContent).active_pane
+        active_pane = self._tabbed.active_pane
 
         # We already have the data, just switch view
         if active_pane.id in self._manager.results[pane]:
-            cw = active_pane.query_one(ContentSwitcher)
+            cw = self._switcher(active_pane.id)
             cw.current = pane.name
             cw.visible_content.focus_self_or_collapsible()
             return
@@ -405,39 +436,36 @@ class DefaultScreen(Screen):
         if active_pane.id not in self._manager.results[TaskType.update]:
             return
 
+        pre, post = self._pre_post[pane]
         match pane:
             case TaskType.update:
                 # No need to handle TaskType.update as that's handled
                 # sufficiently by the two checks above
                 return
             case TaskType.diff:
-                self._manager.background_diff(
-                    active_pane.id,
-                    partial(self._pre, view=pane),
-                    partial(self._post, receiver_tab=pane, setter=partial(self._collapsible_setter, splitter=self._gen_splitter('split_into_files'))),
-                )
+                self._manager.background_diff(active_pane.id, pre, post)
             case TaskType.commits | TaskType.commits_diff:
                 self._manager.background_commits(
                     active_pane.id,
-                    partial(self._pre, view=pane),
-                    partial(self._post, receiver_tab=pane, setter=partial(self._collapsible_setter, splitter=self._gen_splitter('split_into_commits'))),
+                    pre,
+                    post,
                     with_diff=False if pane is TaskType.commits else True,
                 )
             case _:
                 raise RuntimeError("UNREACHABLE")
 
     def action_previous_tab(self):
-        self.query_one(ContentTabs).action_previous_tab()
+        self._content_tabs.action_previous_tab()
 
     def action_next_tab(self):
-        self.query_one(ContentTabs).action_next_tab()
+        self._content_tabs.action_next_tab()
 
     @work
     async def action_search(self):
         match await self.app.push_screen_wait(SearchScreen(self._manager.repos)):
             case str() as result:
                 with suppress(ValueError):
-                    self.query_one('TabbedContent#main').active = result
+                    self._tabbed.active = result
             case None:
                 return
             case _:
@@ -448,7 +476,7 @@ class DefaultScreen(Screen):
 
     @on(StateChange)
     def _update_count(self, event: StateChange):
-        if not (dc := self.query_exactly_one(DoneCounter)).has_class('finished'):
+        if not (dc := self._done_counter).has_class('finished'):
             dc.counter = sum(1 for r in self._manager.repos.values() if r.update in {TaskState.finished_success, TaskState.finished_error})
             if dc.counter == len(self._manager.repos):
                 dc.add_class('finished')
@@ -460,13 +488,12 @@ class DefaultScreen(Screen):
             event.vcs.update is TaskState.finished_success and
             not self._manager.runable_diff(event.vcs.vcs.name)
         ):
-            ct = self.query_exactly_one(f'ContentTab#{ContentTab.add_prefix(event.vcs.vcs.name)}')
-            ct.disabled = True
-            self.query_exactly_one(ContentTabs).hide(ct.sans_prefix(ct.id))
-            self.call_after_refresh(self.app.refresh_bindings)
+            self._tab_by_name[event.vcs.vcs.name].disabled = True
+            self._content_tabs.hide(event.vcs.vcs.name)
+            self.app._schedule_bindings_refresh()
 
     def set_title(self, title: OptGUIText = None, *, upper: OptGUIText = None, lower: OptGUIText = None, name: str):
-        widget = self.query_one(TabbedContent).get_tab(name)
+        widget = self._tab_by_name[name]
         if title is not None:
             widget.label = title
         if upper is not None:
@@ -474,39 +501,74 @@ class DefaultScreen(Screen):
         if lower is not None:
             widget.border_subtitle = lower
 
-    def _is_visible_pane(self, vcs: VCSWrapper, view: TaskType) -> bool:
-        return self.query_one(f"TabPane#{vcs.vcs.name} ContentSwitcher").current == view.name
+    def _currently_visible_view(self, vcs: VCSWrapper) -> str | None:
+        return self._switcher(vcs.vcs.name).current
 
     def _state_to_upper_str(self, vcs: VCSWrapper) -> GUIText:
-        return rich.text.Text.assemble(*(
-            (
-                " " if stategetter(vcs) is TaskState.initial else sign,
-                self.state_colors[stategetter(vcs)] + (" underline" if self._is_visible_pane(vcs, view) else ""),
-            )
-            for view, sign, stategetter in self._char_state
-        ))
+        # There's only a small, fixed set of possible titles, so every one is only assembled once
+        current = self._currently_visible_view(vcs)
+        states = tuple(getattr(vcs, field) for _, _, field in self._char_state)
+        try:
+            return self._upper_titles[(states, current)]
+        except KeyError:
+            pass
+        segments = []
+        for (view, sign, _), state in zip(self._char_state, states):
+            segments.append((
+                " " if state is TaskState.initial else sign,
+                self.state_colors[state] + (" underline" if current == view.name else ""),
+            ))
+        title = self._upper_titles[(states, current)] = rich.text.Text.assemble(*segments)
+        return title
 
     def _state_to_lower_str(self, vcs: VCSWrapper) -> GUIText:
-        return rich.text.Text.assemble(*(
-            (
-                sign if stategetter(vcs) is TaskState.initial else " ",
-                self.state_colors[TaskState.finished_success if self._manager.runable_diff(vcs.vcs.name) else TaskState.initial],
-            )
-            for _, sign, stategetter in self._char_state
-        ))
+        changed = bool(self._manager.runable_diff(vcs.vcs.name))
+        initial = tuple(getattr(vcs, field) is TaskState.initial for _, _, field in self._char_state)
+        try:
+            return self._lower_titles[(initial, changed)]
+        except KeyError:
+            pass
+        color = self.state_colors[TaskState.finished_success if changed else TaskState.initial]
+        segments = []
+        for (_, sign, _), is_initial in zip(self._char_state, initial):
+            segments.append((sign if is_initial else " ", color))
+        title = self._lower_titles[(initial, changed)] = rich.text.Text.assemble(*segments)
+        return title
 
     @on(StateChange)
     def _set_title_from_state_change(self, event: StateChange | VCSWrapper) -> None:
-        match event:
-            case StateChange(wrapped_vcs):
-                vcs = wrapped_vcs
-            case VCSWrapper() as wrapped_vcs:
-                vcs = wrapped_vcs
-            case _:
-                raise RuntimeError("UNREACHABLE")
+        vcs = event.vcs if isinstance(event, StateChange) else event
+
+        # Many state changes arrive in bursts (e.g. all repos starting their
+        # update), so only render each affected title once per refresh
+        self._dirty_titles.add(vcs.vcs.name)
+        if not self._title_flush_scheduled:
+            self._title_flush_scheduled = True
+            self.call_after_refresh(self._flush_titles)
+
+    def _flush_titles(self) -> None:
+        self._title_flush_scheduled = False
+        dirty, self._dirty_titles = self._dirty_titles, set()
+        for name in dirty:
+            self._render_title(self._manager.repos[name])
+
+    def _render_title(self, vcs: VCSWrapper) -> None:
+        # Everything the title is rendered from; if none of it changed, neither did the title
+        key = (
+            vcs.update,
+            vcs.diff,
+            vcs.commits,
+            vcs.commits_diff,
+            self._currently_visible_view(vcs),
+            vcs.vcs.name in self._manager.results[TaskType.update],
+        )
+        if self._last_title_state.get(vcs.vcs.name) == key:
+            return
+        self._last_title_state[vcs.vcs.name] = key
 
+        # The label itself is the repo name, which the TabPane was already
+        # created with; re-setting it would just re-render the same Text
         self.set_title(
-            vcs.vcs.name,
             upper=self._state_to_upper_str(vcs),
             lower=self._state_to_lower_str(vcs),
             name=vcs.vcs.name,
@@ -519,7 +581,7 @@ class DefaultScreen(Screen):
 
     async def _pre(self, vcs: VCSWrapper, view: TaskType):
         await self._make_tab(vcs.vcs.name, view.name)
-        self.query_one(TabbedContent).active_pane.query_one(ContentSwitcher).current = view.name
+        self._tabbed.active_pane.query_one(ContentSwitcher).current = view.name
         setattr(vcs, view.name, TaskState.running)
 
     async def _post(self, result: str | tuple[str, Exception], *, receiver_tab: TaskType, setter: Callable[..., Awaitable], vcs: VCSWrapper, success: bool):
@@ -540,8 +602,9 @@ class DefaultScreen(Screen):
         self.app.get_screen('errors').add_error(taskname, exception)
         tb = Traceback.from_exception(type(exception), exception, exception.__traceback__, show_locals=True)
         self.notify(f'Background task {taskname} errored out with {exception}', title='Background Task Error', severity='error')
-        vert = self.query_exactly_one(f'TabPane#{reponame} MyVertical#{receiver_tab.name}')
+        vert = self._vert(reponame, receiver_tab.name)
         vert.remove_children()
+        self._log_cache.pop((reponame, receiver_tab.name), None)
         await vert.mount_all((
             Static(f'Background Task "{taskname}" raised an error:\n{exception}'),
             Collapsible(
@@ -555,48 +618,74 @@ class DefaultScreen(Screen):
 
     async def _log_setter(self, content: GUIText, *, reponame: str, receiver_tab: TaskType):
         # await self._make_tab(reponame, receiver_tab.name)
+        vert = self._vert(reponame, receiver_tab.name)
         try:
-            log = self.query_exactly_one(f'TabPane#{reponame} MyVertical#{receiver_tab.name} Log#{receiver_tab.name}')
+            log = self._log(reponame, receiver_tab.name)
         except NoMatches:
-            log = Log(id=receiver_tab.name, auto_scroll=False, classes="log")
-            self.query_exactly_one(f'TabPane#{reponame} MyVertical#{receiver_tab.name}').mount(log)
+            log = self._log_cache[(reponame, receiver_tab.name)] = Log(id=receiver_tab.name, auto_scroll=False, classes="log")
+            vert.mount(log)
         log.clear()
-        logwriter = log.write_line
+        # Every write triggers a refresh of the Log, so write in batches
+        lines = io.StringIO(content)
         t1 = time.monotonic()
-        for line in content.split('\n'):
-            logwriter(line)
+        while batch := list(it.islice(lines, 256)):
+            log.write_lines(batch)
             if (t := time.monotonic()) - t1 >= .012:
                 t1 = t
                 await asyncio.sleep(0)
-        self.query_exactly_one(f'TabPane#{reponame} MyVertical#{receiver_tab.name}').allow_vertical_scroll = True
+        vert.allow_vertical_scroll = True
 
-    async def _collapsible_setter(self, raw_content: GUIText, *, reponame: str, receiver_tab: TaskType, splitter: Callable[[str, VCSWrapper], Generator[tuple[str, str]]]):
-        pane_vert = self.query_exactly_one(f'TabPane#{reponame} MyVertical#{receiver_tab.name}')
+    async def _collapsible_setter(self, raw_content: GUIText, *, reponame: str, receiver_tab: TaskType, splitter: SplitCallable):
+        pane_vert = self._vert(reponame, receiver_tab.name)
         pane_vert.add_class("collapsible")
         if not pane_vert.query(Collapsible):
-            await pane_vert.mount_all(
-                Collapsible(Static(rest), title=fst, collapsed=False)
-                for fst, rest in splitter(raw_content, repo=self._manager.repos[reponame])
-            )
+            # Parsing large diffs/logs is pure python work, keep it off the event loop
+            parts = await self._manager.split(reponame, splitter, raw_content)
+            # Mount in chunks, so huge logs don't freeze the UI and the first
+            # entries show up right away
+            for i in range(0, len(parts), 50):
+                await pane_vert.mount_all([
+                    Collapsible(Static(rest), title=fst, collapsed=False)
+                    for fst, rest in parts[i:i+50]
+                ])
+                await asyncio.sleep(0)
         pane_vert.query_one('Collapsible>CollapsibleTitle').focus()
         pane_vert.allow_vertical_scroll = True
         pane_vert.scroll_home()
 
     @staticmethod
-    def _gen_splitter(funcname: str) -> Callable[[str, VCSWrapper], Generator[tuple[str, str]]]:
-        def splitter(input: str, repo: VCSWrapper) -> Generator[tuple[str, str]]:
-            splitfunc = getattr(repo.vcs, funcname)
-            for in_ in splitfunc(input.split("\n")):
-                fst, *rest = in_.split('\n')
-                yield fst, '\n'.join(rest)
-        return splitter
+    def _gen_splitter(funcname: str) -> SplitCallable:
+        # Must stay picklable to be sent to the manager's process pool
+        return partial(vcs.split_titled, funcname=funcname)
 
     def _make_tab(self, reponame: str, tabname: str) -> Awaitable:
         if reponame not in self._manager.repos:
             raise RuntimeError(f"Cannot create tab for unconfigured repo {reponame}")
-        if self.query(f"TabPane#{reponame} MyVertical#{tabname}"):
+        if (reponame, tabname) in self._vert_cache:
             return asyncio.sleep(0)  # just something awaitable that's essentially do-nothing
-        return self.query_one(f"TabPane#{reponame} ContentSwitcher").add_content(MyVertical(id=tabname))
+        vert = self._vert_cache[(reponame, tabname)] = MyVertical(id=tabname)
+        return self._switcher(reponame).add_content(vert)
+
+    def _switcher(self, reponame: str) -> ContentSwitcher:
+        try:
+            return self._switcher_cache[reponame]
+        except KeyError:
+            cs = self._switcher_cache[reponame] = self._tabbed.get_pane(reponame).get_child_by_id(reponame, ContentSwitcher)
+            return cs
+
+    def _vert(self, reponame: str, tabname: str) -> MyVertical:
+        try:
+            return self._vert_cache[(reponame, tabname)]
+        except KeyError:
+            vert = self._vert_cache[(reponame, tabname)] = self._switcher(reponame).get_child_by_id(tabname, MyVertical)
+            return vert
+
+    def _log(self, reponame: str, tabname: str) -> Log:
+        try:
+            return self._log_cache[(reponame, tabname)]
+        except KeyError:
+            log = self._log_cache[(reponame, tabname)] = self._vert(reponame, tabname).get_child_by_id(tabname, Log)
+            return log
 
 
 class ReposApp(App):
@@ -613,10 +702,22 @@ class ReposApp(App):
     def __init__(self, config_path: str | None):
         super().__init__()
         self._config_path = config_path
+        self._bindings_dirty = False
 
     def on_mount(self):
         self.push_screen('default')
 
+    def _schedule_bindings_refresh(self):
+        # Bursts of state changes would otherwise walk the binding tree
+        # several times per frame; coalesce them into one refresh.
+        if not self._bindings_dirty:
+            self._bindings_dirty = True
+            self.call_after_refresh(self._do_refresh_bindings)
+
+    def _do_refresh_bindings(self):
+        self._bindings_dirty = False
+        self.refresh_bindings()
+
     def action_show_error_screen(self):
         if self.get_screen('errors') not in self.screen_stack:
             self.push_screen('errors')
@@ -625,6 +726,6 @@ class ReposApp(App):
         self.get_screen('default').shutdown()
         super().exit()
 
-    def _debug_run(self):
+    def _debug_run(self, run: Callable[[Awaitable], Any] = asyncio.run):
         from ._debug import run_async_debug
-        return asyncio.run(run_async_debug(self))
+        return run(run_async_debug(self))
@@ -1,5 +1,9 @@
 import abc
-from collections.abc import Callable, Generator, Iterable, Mapping
+import asyncio
+from collections.abc import Generator, Iterable, Mapping
+from contextlib import suppress
+import functools
+import locale
 from os import PathLike
 from pathlib import Path
 import re
@@ -18,6 +22,19 @@ except ImportError:
 import unidiff
 
 
+_COMMIT_RE = re.compile(r'^commit [a-fA-F0-9]+$', re.MULTILINE)
+_GIT_UPDATING = 'Updating '
+_GIT_UPDATING_LEN = len(_GIT_UPDATING)
+_HG_NEW_CHANGESETS = 'new changesets '
+# Drafts get a suffix, e.g. "new changesets abc:def (2 drafts)"
+_HG_NEW_CHANGESETS_RE = re.compile(r'^new changesets (\S+)(?: \(.*\))?$', re.MULTILINE)
+
+
+def _decode(data: bytes) -> str:
+    # Same as subprocess.run(..., text=True) would give us
+    return data.decode(locale.getpreferredencoding(False)).replace('\r\n', '\n').replace('\r', '\n')
+
+
 class VCSError(Exception):
     pass
 
@@ -49,9 +66,17 @@ class VCS(metaclass=abc.ABCMeta):
             for altname in altnames:
                 cls.VCS[altname] = cls
 
-    def exec(self, *proc_args: PathLike | str) -> subprocess.CompletedProcess:
+    async def exec(self, *proc_args: PathLike | str) -> subprocess.CompletedProcess:
+        proc = await asyncio.create_subprocess_exec(*proc_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         try:
-            return subprocess.run(proc_args, capture_output=True, text=True, check=True)
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            with suppress(ProcessLookupError):
+                proc.kill()
+            raise
+        cp = subprocess.CompletedProcess(proc_args, proc.returncode, _decode(stdout), _decode(stderr))
+        try:
+            cp.check_returncode()
         except subprocess.CalledProcessError as cpe:
             raise VCSOperationError(
                 textwrap.dedent(f'''
@@ -60,27 +85,40 @@ Error while working in repo {self.name}:
 Output: "{cpe.stdout}"
 Err: "{cpe.stderr}"''')
             ) from cpe
+        return cp
 
     @abc.abstractmethod
-    def clone(self) -> str:
+    async def clone(self) -> str:
         pass
 
     @abc.abstractmethod
-    def update(self) -> str:
+    async def update(self) -> str:
         pass
 
     @abc.abstractmethod
-    def diff(self, *args: str | PathLike) -> str:
+    async def diff(self, *args: str | PathLike) -> str:
         pass
 
     @abc.abstractmethod
-    def commits(self, *args: str, with_diff: bool = False) -> str:
+    async def commits(self, *args: str, with_diff: bool = False) -> str:
         pass
 
     @classmethod
     def get_diff_args_from_update_msg(cls, txt: str) -> tuple[str] | None:
         return cls.get_diff_args_from_update_lines(txt.split('\n'))
 
+    @staticmethod
+    def _line_after_prefix(txt: str, prefix: str) -> str | None:
+        # Lets str.find do the scanning instead of splitting txt and checking each line
+        if txt.startswith(prefix):
+            start = len(prefix)
+        elif (idx := txt.find('\n' + prefix)) != -1:
+            start = idx + 1 + len(prefix)
+        else:
+            return None
+        end = txt.find('\n', start)
+        return txt[start:] if end == -1 else txt[start:end]
+
     @staticmethod
     @abc.abstractmethod
     def get_diff_args_from_update_lines(lines: Iterable[str]) -> tuple[str] | None:
@@ -88,47 +126,50 @@ Err: "{cpe.stderr}"''')
 
     @staticmethod
     @abc.abstractmethod
-    def split_into_commits(lines: Iterable[str]) -> list[str]:
+    def split_into_commits(lines: str | Iterable[str]) -> list[str]:
         pass
 
-    def update_or_clone(self) -> Callable[[], str]:
-        return self.update if self.dest.exists() else self.clone
+    async def update_or_clone(self) -> str:
+        return await (self.update() if self.dest.exists() else self.clone())
 
 
 class Git(VCS, vcsname='git'):
-    def clone(self) -> str:
+    async def clone(self) -> str:
         # Git clone always outputs to stderr when being piped
-        return self.exec('git', 'clone', self.source, self.dest).stderr
+        return (await self.exec('git', 'clone', self.source, self.dest)).stderr
 
-    def update(self) -> str:
-        p = self.exec('git', '-C', self.dest, 'pull')
+    async def update(self) -> str:
+        p = await self.exec('git', '-C', self.dest, 'pull')
         return p.stdout if p.returncode == 0 else p.stderr
 
-    def diff(self, *args: str | PathLike) -> str:
-        return self.exec('git', '-C', self.dest, 'diff', *args).stdout.rstrip()
+    async def diff(self, *args: str | PathLike) -> str:
+        return (await self.exec('git', '-C', self.dest, 'diff', *args)).stdout.rstrip()
 
-    def commits(self, *args: str, with_diff: bool = False) -> str:
+    async def commits(self, *args: str, with_diff: bool = False) -> str:
         log_with_args = ['log']
         if with_diff:
             log_with_args.append('-p')
-        return self.exec('git', '-C', self.dest, *log_with_args, *args).stdout
-
-    @staticmethod
-    def _check_for_new_commit_start(line):
-        return re.match(r'^commit [a-fA-F0-9]+$', line) is not None
-
-    def split_into_commits(self, lines: Iterable[str]) -> Generator[str]:
-        commit = []
-        for line in lines:
-            if self._check_for_new_commit_start(line) and commit:
-                yield '\n'.join(commit)
-                commit = [line]
-            else:
-                commit.append(line)
-        yield '\n'.join(commit)
-
-    def split_into_files(self, lines: Iterable[str]) -> Generator[str]:
-        for pfile in unidiff.PatchSet(line+'\n' for line in lines):
+        return (await self.exec('git', '-C', self.dest, *log_with_args, *args)).stdout
+
+    def split_into_commits(self, lines: str | Iterable[str]) -> Generator[str]:
+        # Let the regex engine find the commit boundaries in one pass over the
+        # whole log, instead of checking every single line in python
+        text = lines if isinstance(lines, str) else '\n'.join(lines)
+        start = 0
+        for match in _COMMIT_RE.finditer(text):
+            if match.start() == 0:
+                continue
+            # Leave out the newline separating the commits
+            yield text[start:match.start() - 1]
+            start = match.start()
+        yield text[start:]
+
+    def split_into_files(self, lines: str | Iterable[str]) -> Generator[str]:
+        # Hand unidiff one contiguous string instead of a fresh string per line
+        text = lines if isinstance(lines, str) else '\n'.join(lines)
+        if not text.endswith('\n'):
+            text += '\n'
+        for pfile in unidiff.PatchSet(text):
             if pfile.is_added_file:
                 title = f"+ {pfile.path}"
             elif pfile.is_removed_file:
@@ -142,28 +183,32 @@ class Git(VCS, vcsname='git'):
 
             yield f"{title}\n{pfile}"
 
+    @classmethod
+    def get_diff_args_from_update_msg(cls, txt: str) -> tuple[str] | None:
+        if (revs := cls._line_after_prefix(txt, _GIT_UPDATING)) is not None:
+            return (revs, )
+
     @staticmethod
     def get_diff_args_from_update_lines(lines: Iterable[str]) -> tuple[str] | None:
-        prefix = 'Updating '
         for line in lines:
-            if line.startswith(prefix):
-                return (line[len(prefix):], )
+            if line.startswith(_GIT_UPDATING):
+                return (line[_GIT_UPDATING_LEN:], )
 
 
 class Mercurial(VCS, vcsname='mercurial', altnames=['hg']):
-    def clone(self) -> str:
-        p = self.exec('hg', 'clone', self.source, self.dest)
+    async def clone(self) -> str:
+        p = await self.exec('hg', 'clone', self.source, self.dest)
         return p.stdout if p.returncode == 0 else p.stderr
 
-    def update(self) -> str:
-        p = self.exec('hg', '--cwd', self.dest, 'pull', '--update')
+    async def update(self) -> str:
+        p = await self.exec('hg', '--cwd', self.dest, 'pull', '--update')
         return p.stdout if p.returncode == 0 else p.stderr
 
-    def diff(self, *args: str | PathLike) -> str:
-        p = self.exec('hg', '--cwd', self.dest, 'diff', *args)
+    async def diff(self, *args: str | PathLike) -> str:
+        p = await self.exec('hg', '--cwd', self.dest, 'diff', *args)
         return p.stdout if p.returncode == 0 else p.stderr
 
-    def commits(self, *args: str, with_diff: bool = False) -> str:
+    async def commits(self, *args: str, with_diff: bool = False) -> str:
         log_with_args = ['log']
         if with_diff:
             log_with_args.append('-p')
@@ -174,33 +219,60 @@ class Mercurial(VCS, vcsname='mercurial', altnames=['hg']):
                 new_args = f"{from_[:-1]}:"
             case _:
                 raise RuntimeError("UNREACHABLE")
-        p = self.exec('hg', '--cwd', self.dest, *log_with_args, *new_args)
+        p = await self.exec('hg', '--cwd', self.dest, *log_with_args, *new_args)
         return p.stdout if p.returncode == 0 else p.stderr
 
     def split_into_commits():
         pass
 
+    @classmethod
+    def get_diff_args_from_update_msg(cls, txt: str) -> tuple[str] | None:
+        if (match := _HG_NEW_CHANGESETS_RE.search(txt)) is not None:
+            return cls._diff_args_from_changesets(match.group(1))
+
     def get_diff_args_from_update_lines(lines: Iterable[str]) -> tuple[str] | None:
-        prefix = 'new changesets '
         for line in lines:
-            if line.startswith(prefix):
-                match line[len(prefix):].split(':'):
-                    case [from_]:
-                        return '--from', f'{from_}^'
-                    case [from_, to]:
-                        return '--from', from_, '--to', to
-                    case _:
-                        raise RuntimeError(f'Mercurial "new changesets" line should not have more than one ":": {line}')
-
-
-def get_repos(configpath: Path | str | None = None) -> Generator[VCS, None, None]:
-    with open(Path(configpath if configpath is not None else '~/.config/muchstuff.toml').expanduser(), 'rb') as conffile:
-        conf = tomllib.load(conffile)
-    _DEFAULTS = conf.pop('_DEFAULTS', {})
+            if (match := _HG_NEW_CHANGESETS_RE.match(line)) is not None:
+                return Mercurial._diff_args_from_changesets(match.group(1))
+
+    @staticmethod
+    def _diff_args_from_changesets(changesets: str) -> tuple[str]:
+        match changesets.split(':'):
+            case [from_]:
+                return '--from', f'{from_}^'
+            case [from_, to]:
+                return '--from', from_, '--to', to
+            case _:
+                raise RuntimeError(f'Mercurial "new changesets" line should not have more than one ":": {_HG_NEW_CHANGESETS}{changesets}')
+
+
+def split_titled(content: str, repo: VCS, *, funcname: str) -> list[tuple[str, str]]:
+    parts = []
+    for in_ in getattr(repo, funcname)(content):
+        idx = in_.find('\n')
+        parts.append((in_, '') if idx == -1 else (in_[:idx], in_[idx+1:]))
+    return parts
+
+
+_DEFAULT_CONFIG = Path('~/.config/muchstuff.toml').expanduser()
+
+
+@functools.lru_cache(maxsize=4)
+def _load_conf(path: str, mtime_ns: int) -> dict[str, Any]:
+    # mtime_ns is only part of the cache key, so changed files get reread
+    with open(path, 'rb') as conffile:
+        return tomllib.load(conffile)
+
+
+def get_repos(configpath: Path | str | None = None) -> Generator[tuple[str, VCS], None, None]:
+    path = Path(configpath).expanduser() if configpath is not None else _DEFAULT_CONFIG
+    # Cached, so must not be modified
+    conf = _load_conf(str(path), path.stat().st_mtime_ns)
+    _DEFAULTS = conf.get('_DEFAULTS', {})
     for name, repo_info in conf.items():
-        if isinstance(repo_info, dict):
+        if name != '_DEFAULTS' and isinstance(repo_info, dict):
             repo_info = _DEFAULTS | repo_info
             repo_info['name'] = name
             repo_info['dest'] = Path(repo_info['dest']).expanduser()
             repo_info['source'] = Path(repo_info['source']).expanduser()
-            yield VCS.get_vcs(repo_info['type'], repo_info)
+            yield name, VCS.get_vcs(repo_info['type'], repo_info)